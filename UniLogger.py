@@ -19,18 +19,29 @@ from __future__ import absolute_import, print_function
 #  please maintain this credit header.                  #
 #########################################################
 """
+import os
 import sys
-from threading import Lock
-from os import makedirs, remove, rename
+import atexit
+import traceback
+from threading import Lock, Thread, Event
+from types import MethodType
+from collections import deque
+from functools import lru_cache
+from os import makedirs, remove, rename, environ
 from os.path import join, exists, getsize
-from time import strftime
-from io import StringIO
-import glob
+from time import strftime, localtime, time, time_ns
 
-logfile = StringIO()
-mutex = Lock()
+# Optional dependency for the binary structured-log mode; text mode is
+# used when it is missing
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
 
-_logger_instance = None
+__all__ = ['ColoredLogger', 'get_logger', 'cat_binary_log']
+
+# Numeric level thresholds, mirroring the stdlib logging values
+_LEVEL_NUM = {"DEBUG": 10, "INFO": 20, "WARNING": 30, "ERROR": 40, "CRITICAL": 50}
 
 
 class ColoredLogger:
@@ -43,28 +54,53 @@ class ColoredLogger:
     }
     END = "\033[0m"
     _instances = {}
-    _lock = Lock()
+    _instances_lock = Lock()
+
+    # Queued records are flushed once FLUSH_RECORDS are pending or
+    # every FLUSH_INTERVAL seconds, whichever comes first. If producers
+    # outrun the flusher past MAX_QUEUED pending records, new messages
+    # are dropped (and counted) instead of growing the queue unbounded.
+    FLUSH_RECORDS = 256
+    FLUSH_INTERVAL = 0.05
+    MAX_QUEUED = 8192
+
+    # Timestamp cache: strftime is expensive and the resolution is one
+    # second, so reuse the formatted string within the same second.
+    # A race here is benign: both writers produce the same value.
+    _ts_cache_second = 0
+    _ts_cache_str = ""
 
     SUPPORTS_COLOR = hasattr(sys.stdout, 'isatty') and sys.stdout.isatty()
     encoding = getattr(sys.stdout, 'encoding', None) or ''
     SUPPORTS_UNICODE = encoding.lower().startswith('utf')
-    def __new__(cls, log_path=None, plugin_name="generic", clear_on_start=True, max_size_mb=1):
-        """Singleton for log_path + plugin_name combination"""
-        instance_key = f"{log_path}_{plugin_name}"
-
-        if instance_key not in cls._instances:
-            with cls._lock:
-                if instance_key not in cls._instances:
-                    instance = super().__new__(cls)
-                    cls._instances[instance_key] = instance
-                    instance._initialize(log_path, plugin_name, clear_on_start, max_size_mb)
-
-        return cls._instances[instance_key]
-
-    def _initialize(self, log_path, plugin_name, clear_on_start, max_size_mb):
+    def __new__(cls, log_path=None, plugin_name="generic", clear_on_start=True, max_size_mb=1, binary=False):
+        """Singleton for log_path + plugin_name (+ binary) combination"""
+        key = (log_path, plugin_name, binary)
+
+        instance = cls._instances.get(key)
+        if instance is not None:
+            return instance
+
+        # _initialize has side effects (it opens a descriptor and starts
+        # daemon threads), so first construction is serialized — a racing
+        # loser would otherwise leak its fd and threads for the process
+        # lifetime. The get() above keeps the common path lock-free.
+        with cls._instances_lock:
+            instance = cls._instances.get(key)
+            if instance is None:
+                instance = super().__new__(cls)
+                instance._initialize(log_path, plugin_name, clear_on_start, max_size_mb, binary)
+                cls._instances[key] = instance
+        return instance
+
+    def _initialize(self, log_path, plugin_name, clear_on_start, max_size_mb, binary=False):
         """Initializing the instance"""
         self.plugin_name = plugin_name
         self.max_size_mb = max_size_mb
+        self.min_level = _LEVEL_NUM.get(environ.get("UNILOGGER_LEVEL", "DEBUG"), 10)
+        self.binary = bool(binary and msgpack is not None)
+        if binary and msgpack is None:
+            print("[LOG] msgpack not available, falling back to text logging")
 
         # Determine the path of the log file
         if log_path:
@@ -77,7 +113,8 @@ class ColoredLogger:
                     log_path = None
 
         if log_path:
-            self.log_file = join(log_path, f"{plugin_name}.log")
+            suffix = ".log.msgpack" if self.binary else ".log"
+            self.log_file = join(log_path, f"{plugin_name}{suffix}")
 
             if clear_on_start and exists(self.log_file):
                 try:
@@ -87,166 +124,275 @@ class ColoredLogger:
         else:
             self.log_file = None
 
+        # Track the file size in memory: we are the only writer, so a
+        # counter replaces two stat syscalls per message
+        self._rotate_threshold = int(self.max_size_mb * 1024 * 1024)
+        self._bytes_written = 0
+        if self.log_file and exists(self.log_file):
+            self._bytes_written = getsize(self.log_file)
+
+        # Keep a single descriptor open and buffer writes in memory:
+        # re-opening the file per message is a syscall storm. A raw fd
+        # with O_APPEND bypasses the io layer and appends atomically.
+        self._fd = -1
+        if self.log_file:
+            try:
+                self._fd = os.open(self.log_file, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+            except OSError as e:
+                print(f"Error opening log file {self.log_file}: {e}")
+                self.log_file = None
+
+        # Pre-resolved rotation slot names: rotation is a fixed rename
+        # chain with no directory scan or per-rotation string building
+        self._rotation_slots = (
+            [f"{self.log_file}.{i}" for i in range(1, 6)]
+            if self.log_file else [])
+
+        # MPSC handoff to the flusher thread: deque.append is atomic
+        # under the GIL, so producers enqueue without taking a lock and
+        # never contend with each other. The drain lock only serializes
+        # the consumers (flusher, rotation, shutdown), which is
+        # uncontended in steady state.
+        self._queue = deque()
+        self._flush_event = Event()
+        self._drain_lock = Lock()
+        self._dropped = 0
+        if self._fd >= 0:
+            atexit.register(self._close)
+            Thread(target=self._flusher, daemon=True).start()
+            # Rotation runs on its own thread so the writer never pays
+            # the rename latency
+            self._rotate_event = Event()
+            Thread(target=self._rotate_worker, daemon=True).start()
+
+        # Stable line fragments per level, resolved once per instance:
+        # the only strings built per message are the cached timestamp
+        # and the message itself
+        self._console_parts = {}
+        self._file_parts = {}
+        for lvl, (color, label) in _CONSOLE_LEVELS.items():
+            if self.SUPPORTS_COLOR and color:
+                self._console_parts[lvl] = (
+                    f" {plugin_name} {label} {color}", self.END + "\n")
+            else:
+                self._console_parts[lvl] = (f" {plugin_name} {label} ", "\n")
+        for lvl, (_c, label) in _FILE_LEVELS.items():
+            self._file_parts[lvl] = f" {plugin_name} {label} "
+        _d_color, _d_label = _DEFAULT_LEVEL
+        self._console_default = (f" {plugin_name} {_d_label} ", "\n")
+        self._file_default = f" {plugin_name} {_d_label} "
+
+        # Bind the hot-path variant once; the color decision already
+        # lives in the precomputed fragments
+        self._log_fast = MethodType(
+            _log_binary if self.binary else _log_console, self)
+
         self._initialized = True
 
-    def _get_level_display(self, level):
-        """Get the appropriate display format for the level"""
-        color, label = self.LEVELS.get(level.upper(), ("", "[LOG] "))
-
-        # Se non supporta Unicode, usa versioni testuali
-        if not self.SUPPORTS_UNICODE:
-            text_labels = {
-                "DEBUG": ("\033[92m", "[DEBUG]"),
-                "INFO": ("\033[97m", "[INFO] "),
-                "WARNING": ("\033[93m", "[WARN] "),
-                "ERROR": ("\033[91m", "[ERROR]"),
-                "CRITICAL": ("\033[95m", "[CRITICAL]"),
-            }
-            color, label = text_labels.get(level.upper(), ("", "[LOG] "))
-
-        return color, label
     def log(self, level, message):
-        """Base logging method"""
+        """Base logging method (level must be uppercase)"""
         if not hasattr(self, '_initialized'):
             return
-
-        color, label = self._get_level_display(level)
-        timestamp = strftime("%Y-%m-%d %H:%M:%S")
-
-        console_message = f"{timestamp} {self.plugin_name} {label} {message}"
-
-        # Per file log (senza colori e con emoticon sostituite se necessario)
-        file_label = label
-        if not self.SUPPORTS_UNICODE:
-            # Sostituisci emoticon con testo
-            file_label = file_label.replace("🐛", "[DEBUG]")
-            file_label = file_label.replace("ℹ️", "[INFO]")
-            file_label = file_label.replace("⚠️", "[WARN]")
-            file_label = file_label.replace("❌", "[ERROR]")
-            file_label = file_label.replace("💀", "[CRITICAL]")
-
-        file_message = f"{timestamp} {self.plugin_name} {file_label} {message}"
-
-        # Output a console
-        if self.SUPPORTS_COLOR and color:
-            print(f"{timestamp} {self.plugin_name} {label} {color}{message}{self.END}")
-        else:
-            print(console_message)
-        # Output a file
-        if self.log_file:
-            self._write_to_file(file_message)
-            self._check_rotation()
+        self._log_fast(level, message)
 
     def _write_to_file(self, message):
-        """Secure file writing with timeout"""
+        """Buffered file writing; actual I/O happens on flush"""
+        self._write_raw(message.encode('utf-8') + b"\n")
+
+    def _write_raw(self, encoded):
+        """Producer side: enqueue one encoded record, lock-free"""
+        if len(self._queue) >= self.MAX_QUEUED:
+            # Backpressure: drop rather than grow without bound; the
+            # flusher reports the count with the next batch
+            self._dropped += 1
+            self._flush_event.set()
+            return
+        self._queue.append(encoded)
+        # Benign race: the rotation threshold does not need an exact count
+        self._bytes_written += len(encoded)
+        if len(self._queue) >= self.FLUSH_RECORDS:
+            self._flush_event.set()
+
+    def _drain(self):
+        """Write all queued records to disk (caller holds _drain_lock)"""
+        records = []
+
+        # Report drops before the empty-queue check: a drop racing a
+        # concurrent drain can leave the counter set with nothing
+        # queued, and the notice must still reach the file (e.g. on the
+        # final flush at shutdown)
+        dropped = self._dropped
+        if dropped:
+            self._dropped = 0
+            notice = f"<{dropped} messages dropped>"
+            if self.binary:
+                records.append(msgpack.packb(
+                    (time_ns(), 30, self.plugin_name, notice)))
+            else:
+                records.append((notice + "\n").encode('utf-8'))
+
+        queue = self._queue
+        popleft = queue.popleft
+        while queue:
+            try:
+                records.append(popleft())
+            except IndexError:
+                break
+        if not records:
+            return
         try:
-            with open(self.log_file, "a", encoding='utf-8') as f:
-                f.write(message + "\n")
-                f.flush()
-        except Exception as e:
+            if _os_writev is not None:
+                # Scatter-gather write: the kernel walks the record list
+                # directly, with no joined-copy allocation per flush
+                for start in range(0, len(records), _IOV_MAX):
+                    _os_writev(self._fd, records[start:start + _IOV_MAX])
+            else:
+                _os_write(self._fd, b"".join(records))
+        except OSError as e:
             print(f"[LOG ERROR] Cannot write to {self.log_file}: {e}")
 
+    def _flush(self):
+        """Flush any queued log data to disk"""
+        with self._drain_lock:
+            self._drain()
+
+    def _flusher(self):
+        """Background thread: drain the queue every FLUSH_INTERVAL
+        seconds, or sooner when a producer signals a long queue"""
+        while True:
+            self._flush_event.wait(self.FLUSH_INTERVAL)
+            self._flush_event.clear()
+            self._flush()
+
+    def _close(self):
+        """Flush remaining data and close the file handle at shutdown"""
+        self._flush()
+        try:
+            os.close(self._fd)
+        except OSError:
+            pass
+
     def _check_rotation(self):
         """Check if you need to rotate the log"""
-        try:
-            if not exists(self.log_file):
-                return
+        if self._bytes_written > self._rotate_threshold:
+            self._rotate_event.set()
+
+    def _rotate_worker(self):
+        """Background thread: perform rotation off the writer's call stack"""
+        while True:
+            self._rotate_event.wait()
+            self._rotate_event.clear()
+            self._do_rotate()
+
+    def _do_rotate(self):
+        """Rotate under the drain lock so no consumer sees a stale handle"""
+        with self._drain_lock:
+            self._drain()
+            try:
+                os.close(self._fd)
+            except OSError:
+                pass
+            self._rotate_logs()
+            self._bytes_written = 0
+            try:
+                self._fd = os.open(self.log_file, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+            except OSError as e:
+                # Null the descriptor: keeping the closed number around
+                # would have later flushes write into whatever file the
+                # kernel recycles it for
+                self._fd = -1
+                print(f"Error reopening log file {self.log_file}: {e}")
 
-            file_size = self._get_file_size_mb()
-            if file_size > self.max_size_mb:
-                self._rotate_logs()
-        except Exception as e:
-            print(f"[LOG ERROR] Rotation check failed: {e}")
+    def _rotate_logs(self):
+        """Shuffle the backup files (renames only; _do_rotate owns the handle)"""
+        slots = self._rotation_slots
 
-    def _get_file_size_mb(self):
-        """Returns the file size in MB"""
+        # Fixed rename chain over pre-resolved names; a missing slot just
+        # raises ENOENT, which is cheaper than probing with exists()
         try:
-            return getsize(self.log_file) / (1024 * 1024)
-        except:
-            return 0
-
-    def _rotate_logs(self):
-        """Perform log rotation"""
+            remove(slots[4])
+        except OSError:
+            pass
+        for i in range(4, 0, -1):
+            try:
+                rename(slots[i - 1], slots[i])
+            except OSError:
+                pass
         try:
-            base_name = self.log_file
-            pattern = f"{base_name}.*"
-
-            # Find all existing backup files
-            backups = sorted(glob.glob(pattern), reverse=True)
-
-            # Delete the oldest backups (keep only the last 5)
-            for old_backup in backups[4:]:
-                try:
-                    remove(old_backup)
-                except:
-                    pass
-
-            # Rename existing files
-            for i in range(min(len(backups), 4), 0, -1):
-                old_name = f"{base_name}.{i}" if i > 1 else base_name
-                new_name = f"{base_name}.{i + 1}"
-
-                if exists(old_name):
-                    try:
-                        rename(old_name, new_name)
-                    except:
-                        pass
-
-        except Exception as e:
+            rename(self.log_file, slots[0])
+        except OSError as e:
             print(f"[LOG ERROR] Log rotation failed: {e}")
 
+    def set_level(self, name):
+        """Change the minimum level at runtime (e.g. set_level('INFO'))"""
+        self.min_level = _LEVEL_NUM.get(name.upper(), 10)
+
     def debug(self, message, *args):
         """Log debug message"""
-        try:
-            msg = message % args if args else message
-        except (TypeError, ValueError):
-            msg = message  # fallback se è già una f-string
-        self.log("DEBUG", msg)
+        if self.min_level > 10:
+            return
+        if args:
+            try:
+                message = message % args
+            except (TypeError, ValueError):
+                pass  # fallback se è già una f-string
+        self._log_fast("DEBUG", message)
 
     def info(self, message, *args):
         """Log info message"""
-        try:
-            msg = message % args if args else message
-        except (TypeError, ValueError):
-            msg = message
-        self.log("INFO", msg)
+        if self.min_level > 20:
+            return
+        if args:
+            try:
+                message = message % args
+            except (TypeError, ValueError):
+                pass
+        self._log_fast("INFO", message)
 
     def warning(self, message, *args):
         """Log warning message"""
-        try:
-            msg = message % args if args else message
-        except (TypeError, ValueError):
-            msg = message
-        self.log("WARNING", msg)
+        if self.min_level > 30:
+            return
+        if args:
+            try:
+                message = message % args
+            except (TypeError, ValueError):
+                pass
+        self._log_fast("WARNING", message)
 
     def error(self, message, *args):
         """Log error message"""
-        try:
-            msg = message % args if args else message
-        except (TypeError, ValueError):
-            msg = message
-        self.log("ERROR", msg)
+        if self.min_level > 40:
+            return
+        if args:
+            try:
+                message = message % args
+            except (TypeError, ValueError):
+                pass
+        self._log_fast("ERROR", message)
 
     def critical(self, message, *args):
         """Log critical message"""
-        try:
-            msg = message % args if args else message
-        except (TypeError, ValueError):
-            msg = message
-        self.log("CRITICAL", msg)
+        if self.min_level > 50:
+            return
+        if args:
+            try:
+                message = message % args
+            except (TypeError, ValueError):
+                pass
+        self._log_fast("CRITICAL", message)
 
     def exception(self, message, *args):
         """Log an exception with traceback"""
-        import sys
-        import traceback
-        exc_info = sys.exc_info()
-        traceback_text = ''.join(traceback.format_exception(*exc_info))
-        try:
-            msg = message % args if args else message
-        except (TypeError, ValueError):
-            msg = message
-        full_message = f"{msg}\n{traceback_text}"
-        self.log("ERROR", full_message)
+        if self.min_level > 40:
+            return
+        traceback_text = traceback.format_exc()
+        if args:
+            try:
+                message = message % args
+            except (TypeError, ValueError):
+                pass
+        self._log_fast("ERROR", f"{message}\n{traceback_text}")
 
     def show_message(self, session, text, timeout=5):
         """Display a message on the screen (requires session)"""
@@ -267,7 +413,99 @@ class ColoredLogger:
         self.debug("MessageBox closed")
 
 
-def get_logger(log_path=None, plugin_name="generic", clear_on_start=True, max_size_mb=1):
+# Fully-resolved level tables, computed once at import time so log()
+# does two dict lookups instead of rebuilding labels per call
+_DEFAULT_LEVEL = ("", "[LOG] ")
+
+_ASCII_LEVELS = {
+    "DEBUG": ("\033[92m", "[DEBUG]"),
+    "INFO": ("\033[97m", "[INFO] "),
+    "WARNING": ("\033[93m", "[WARN] "),
+    "ERROR": ("\033[91m", "[ERROR]"),
+    "CRITICAL": ("\033[95m", "[CRITICAL]"),
+}
+
+if ColoredLogger.SUPPORTS_UNICODE:
+    _CONSOLE_LEVELS = ColoredLogger.LEVELS
+else:
+    _CONSOLE_LEVELS = _ASCII_LEVELS
+
+# File output gets the same label as the console, without the color code
+_FILE_LEVELS = {k: ("", label) for k, (_c, label) in _CONSOLE_LEVELS.items()}
+
+
+# Bound method reference: one write call per message, without print()'s
+# argument handling and second write for the line terminator
+_stdout_write = sys.stdout.write
+
+# Pre-bound write syscall wrappers for the flush path: skip the os
+# module attribute lookup on every flush, leaving one C call plus one
+# syscall per batch. writev is POSIX-only; without it batches are
+# joined and pushed through plain write.
+_os_write = os.write
+_os_writev = getattr(os, "writev", None)
+
+# Most kernels cap writev at IOV_MAX buffers per call (commonly 1024)
+_IOV_MAX = 1024
+
+
+# Hot-path log variant: _initialize binds it as _log_fast. Capability
+# branches are gone — color and labels are baked into the per-instance
+# fragments, so each line is a single join around the message
+def _log_console(self, level, message):
+    """Hot-path logging: stitch precomputed fragments around the message"""
+    prefix, suffix = self._console_parts.get(level, self._console_default)
+    now = int(time())
+    if now != ColoredLogger._ts_cache_second:
+        ColoredLogger._ts_cache_second = now
+        ColoredLogger._ts_cache_str = strftime("%Y-%m-%d %H:%M:%S", localtime(now))
+    timestamp = ColoredLogger._ts_cache_str
+
+    _stdout_write("".join((timestamp, prefix, message, suffix)))
+    if self.log_file:
+        self._write_to_file("".join(
+            (timestamp, self._file_parts.get(level, self._file_default), message)))
+        self._check_rotation()
+
+
+def _log_binary(self, level, message):
+    """Hot-path logging in binary mode: one msgpack record per message,
+    with no timestamp formatting, labels, or ANSI codes"""
+    if self.log_file:
+        self._write_raw(msgpack.packb(
+            (time_ns(), _LEVEL_NUM.get(level, 0), self.plugin_name, message)))
+        self._check_rotation()
+
+
+def cat_binary_log(path, out=None):
+    """Render a binary log file with the text formatter"""
+    if msgpack is None:
+        raise RuntimeError("msgpack is required to read binary logs")
+    out = out or sys.stdout
+    names = {num: name for name, num in _LEVEL_NUM.items()}
+    with open(path, "rb") as f:
+        for ts_ns, level_num, plugin_name, message in msgpack.Unpacker(f):
+            timestamp = strftime("%Y-%m-%d %H:%M:%S", localtime(ts_ns // 1000000000))
+            level = names.get(level_num, "LOG")
+            out.write(f"{timestamp} {plugin_name} [{level}] {message}\n")
+
+
+@lru_cache(maxsize=None)
+def _cached_logger(log_path, plugin_name, clear_on_start, max_size_mb, binary):
+    """Memoized construction: repeated get_logger calls resolve in
+    lru_cache's C-level hash table without building an instance key.
+    The class _instances registry stays authoritative, so direct
+    ColoredLogger() construction returns the same singleton."""
+    return ColoredLogger(
+        log_path=log_path,
+        plugin_name=plugin_name,
+        clear_on_start=clear_on_start,
+        max_size_mb=max_size_mb,
+        binary=binary
+    )
+
+
+def get_logger(log_path=None, plugin_name="generic", clear_on_start=True, max_size_mb=1, binary=False):
     """
     Factory function to get a logger instance
     Args:
@@ -275,15 +513,12 @@ def get_logger(log_path=None, plugin_name="generic", clear_on_start=True, max_si
         plugin_name (str): Plugin name (used for file name)
         clear_on_start (bool): Whether to clear the log on startup
         max_size_mb (int): Maximum size in MB before rotation
+        binary (bool): Write msgpack records instead of text (needs
+            msgpack; render them back with cat_binary_log)
     Returns:
         ColoredLogger: Logger instance
     """
-    return ColoredLogger(
-        log_path=log_path,
-        plugin_name=plugin_name,
-        clear_on_start=clear_on_start,
-        max_size_mb=max_size_mb
-    )
+    return _cached_logger(log_path, plugin_name, clear_on_start, max_size_mb, binary)
 
 
 # Test function
@@ -309,7 +544,10 @@ def test_logger():
 
 
 if __name__ == "__main__":
-    test_logger()
+    if len(sys.argv) > 2 and sys.argv[1] == "cat":
+        cat_binary_log(sys.argv[2])
+    else:
+        test_logger()
 
 
 """